@@ -1,55 +1,62 @@
-import base64
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
 from pathlib import Path
 import os, openai
 import wave
-import base64
 
-from uuid import uuid4
+from io import BytesIO
+from functools import lru_cache
 
 from pydub import AudioSegment
-from pathlib import Path
 import numpy as np
 
 def b64(path):
-    return base64.b64encode(open(path, "rb").read()).decode("utf-8")
+    return base64.b64encode(Path(path).read_bytes()).decode("utf-8")
+def to_data_uri(path, _type='audio'):
+    ext = Path(path).suffix.lstrip('.').lower() or 'wav'
+    return f"data:{_type}/{'mpeg' if ext == 'mp3' else ext};base64," + b64(path)
+
+@lru_cache(maxsize=64)
+def _to_audio_cached(path, min_vol, boost, mtime_ns, size):
+    seg = AudioSegment.from_wav(path)
+    gain = max(0, min_vol - seg.dBFS) + boost
+    if not gain:
+        return b64(path)
+    buf = BytesIO()
+    (seg + gain).export(buf, format='wav')
+    return base64.b64encode(buf.getvalue()).decode("utf-8")
 
 def to_audio(path, min_vol=None, boost=0):
     # if min_vol is not None:
     min_vol = -100 if min_vol is None else min_vol
-    
-    seg = AudioSegment.from_wav(path)
-    temp_name = f'{uuid4()}.wav'
-    (seg + max(0, min_vol - seg.dBFS) + boost).export(temp_name, format='wav')
-    res = {'type': "input_audio", "input_audio": {'data': b64(temp_name), 'format': 'wav'}}
-    Path(temp_name).unlink()
-
-    return {'type': "input_audio", "input_audio": {'data': b64(path), 'format': 'wav'}}
+    st = os.stat(path)
+    data = _to_audio_cached(str(path), min_vol, boost, st.st_mtime_ns, st.st_size)
+    return {'type': "input_audio", "input_audio": {'data': data, 'format': 'wav'}}
 
-import re
 def process_resp(resp, verbose=False):
     resp = resp.choices[0].message.content
-    thinking = re.findall(r'<think>(.*)</think>', resp, re.DOTALL)[0]
-    if verbose:
-        print('THINKING', thinking)
-    return re.findall(r'(?:<think>.*</think>)*\n*(.+)', resp, re.DOTALL)[0]
+    i = resp.rfind('</think>')
+    if verbose and i >= 0:
+        print('THINKING', resp[:i].split('<think>', 1)[-1])
+    return (resp[i + len('</think>'):] if i >= 0 else resp).lstrip('\n ')
 def save_audio(resp, out_name='output.wav'):
-    (f := open(out_name, "wb")).write(base64.b64decode(resp.choices[0].message.audio.data))
+    Path(out_name).write_bytes(base64.b64decode(resp.choices[0].message.audio.data))
 def as_type(url, _type='audio'):
     return {'type': f'{_type}_url', f'{_type}_url': {'url': url}}
 def as_text(t):
     return {'type': 'text', 'text': t}
 
 import requests
-import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 endpoint = 'https://tmpfiles.org/api/v1/upload'
+_HTTP = requests.Session()
+_HTTP.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=Retry(
+    total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["POST"])))
 def upload_temp(f):
-    resp = requests.post(endpoint, files={'file': open(f, 'rb')})
-    t = 1
-    while True:
-        try:
-            return resp.json()['data']['url'].replace('.org/', '.org/dl/')
-        except:
-            pass
-        time.sleep(t)
-        print('Sleep', t)
-        t *= 2
\ No newline at end of file
+    with open(f, 'rb') as fh:
+        resp = _HTTP.post(endpoint, files={'file': fh}, timeout=30)
+    resp.raise_for_status()
+    return resp.json()['data']['url'].replace('.org/', '.org/dl/')
\ No newline at end of file